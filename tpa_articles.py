@@ -3,74 +3,156 @@ import csv
 import json
 import os
 import re
-import urllib.request
-import xml.etree.ElementTree as ET
-from collections import Counter
+from collections import defaultdict, namedtuple
 from datetime import datetime, timezone
+from functools import lru_cache
+from io import BytesIO
 
 import aiohttp
+import orjson
+from lxml import etree
 
 BASE_URL = "https://thepaymentsassociation.org"
 SITEMAP_NS = 'http://www.sitemaps.org/schemas/sitemap/0.9'
 CUTOFF_YEAR = datetime.now(timezone.utc).year - 3
-semaphore = asyncio.Semaphore(20)
 
 HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
 
+ArticleRow = namedtuple(
+    'ArticleRow', ['url', 'title', 'author', 'published_date', 'article_type', 'status', 'reason']
+)
+
 ARTICLE_TYPE_OVERRIDES = {
     'thought-leadership-quarterly': 'Thought Leadership',
     'thought-leadership': 'Thought Leadership',
     'payments-intelligence': 'Payments Intelligence',
 }
 
-
-def fetch_xml(url, retries=3, backoff=5):
+# Subset of tpa_crawl.SKIP_PATTERNS that applies to article URLs; the date
+# patterns are left out because article slugs legitimately contain dates
+ARTICLE_SKIP_PATTERNS = [
+    r'\?',
+    r'/page/',
+    r'/feed/',
+    r'/author/',
+]
+
+# Pages are scanned as raw bytes; only the matched snippets get decoded
+_TITLE_RE = re.compile(rb'<title>(.*?)</title>')
+_CONTAINER_RE = re.compile(rb'class="([^"]*elementor-location-single[^"]*)"')
+_FILTER_RE = re.compile(r'filter_types-([a-z0-9-]+)')
+_CATEGORY_RE = re.compile(r'\bcategory-([a-z0-9-]+)\b')
+_SKIP_RE = re.compile('|'.join(f'(?:{p})' for p in ARTICLE_SKIP_PATTERNS))
+_ICON = {'DELETE_CANDIDATE': '🔴', 'REVIEW': '🟠', 'KEEP': '🟢'}
+_MONTHS = ('Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec')
+
+
+async def fetch_locs(session, url, retries=3, backoff=5):
+    """Return the text of every <loc> element in the sitemap at url."""
     for attempt in range(retries):
         try:
-            req = urllib.request.Request(url, headers=HEADERS)
-            with urllib.request.urlopen(req) as r:
-                return ET.fromstring(r.read())
+            async with session.get(url) as resp:
+                resp.raise_for_status()
+                body = await resp.read()
+            locs = []
+            for _, elem in etree.iterparse(BytesIO(body), tag=f'{{{SITEMAP_NS}}}loc'):
+                locs.append(elem.text or '')
+                elem.clear()
+            return locs
         except Exception as e:
             if attempt < retries - 1:
                 wait = backoff * (attempt + 1)
                 print(f"  Retrying {url} in {wait}s ({e})")
-                import time; time.sleep(wait)
+                await asyncio.sleep(wait)
             else:
                 raise
 
 
-def get_article_urls_from_sitemap():
+async def get_article_urls_from_sitemap(session):
     """Fetch all article URLs directly from the site's XML sitemaps."""
     print("=== Phase 1: Fetching article URLs from sitemap ===")
 
-    root = fetch_xml(BASE_URL + '/sitemap.xml')
+    index_locs = await fetch_locs(session, BASE_URL + '/sitemap.xml')
 
-    post_sitemaps = [
-        loc.text for loc in root.findall(f'.//{{{SITEMAP_NS}}}loc')
-        if 'post-sitemap' in (loc.text or '')
-    ]
+    post_sitemaps = [loc for loc in index_locs if 'post-sitemap' in loc]
     print(f"Found {len(post_sitemaps)} post sitemaps")
 
-    article_urls = set()
-    for sitemap_url in post_sitemaps:
-        sm = fetch_xml(sitemap_url)
-        for loc in sm.findall(f'.//{{{SITEMAP_NS}}}loc'):
-            url = (loc.text or '').rstrip('/')
+    # Post sitemaps are independent, so fetch them concurrently over the shared pool
+    sitemaps = await asyncio.gather(*(fetch_locs(session, u) for u in post_sitemaps))
+
+    article_urls = []
+    for locs in sitemaps:
+        for loc in locs:
+            url = loc.rstrip('/')
             if '/article/' in url:
-                article_urls.add(url)
+                article_urls.append(url)
+    # Dedupe while keeping sitemap order, so runs scrape in a stable order
+    article_urls = list(dict.fromkeys(article_urls))
 
     print(f"Found {len(article_urls)} articles total\n")
-    return list(article_urls)
+    return article_urls
+
+
+def load_previous_results(audit_root):
+    """Return {url: ArticleRow} of DELETE_CANDIDATE rows from the latest articles audit."""
+    # CUTOFF_YEAR only moves forward, so a DELETE_CANDIDATE can never flip back to KEEP;
+    # KEEP and REVIEW rows may have changed and are always re-scraped
+    if not os.path.isdir(audit_root):
+        return {}
+    for run in sorted(os.listdir(audit_root), reverse=True):
+        path = os.path.join(audit_root, run, 'tpa_articles_audit.csv')
+        if os.path.isfile(path):
+            with open(path, newline='') as f:
+                reader = csv.reader(f)
+                next(reader, None)
+                rows = (ArticleRow(*row) for row in reader if len(row) == len(ArticleRow._fields))
+                return {r.url: r for r in rows if r.status == 'DELETE_CANDIDATE'}
+    return {}
+
+
+@lru_cache(maxsize=256)
+def _slug_to_title(slug):
+    # Not str.title(): that would capitalise after digits too ('2nd' -> '2Nd')
+    return ' '.join(w.capitalize() for w in slug.split('-'))
+
+
+def _loads(raw):
+    try:
+        return orjson.loads(raw)
+    except orjson.JSONDecodeError:
+        # orjson is stricter than stdlib (e.g. ints beyond 64 bits, lone surrogates)
+        return json.loads(raw)
+
+
+def _iter_jsonld(html):
+    """Yield the body of each <script type="application/ld+json"> block."""
+    pos = 0
+    while True:
+        i = html.find(b'application/ld+json', pos)
+        if i == -1:
+            return
+        lt = html.rfind(b'<script', 0, i)
+        gt = html.find(b'>', i)
+        if gt == -1:
+            return
+        pos = gt + 1
+        # Only count the marker when it sits inside a <script ...> opening tag
+        if lt == -1 or html.find(b'>', lt, i) != -1:
+            continue
+        end = html.find(b'</script>', gt)
+        if end == -1:
+            return
+        pos = end + 9
+        yield html[gt + 1:end]
 
 
 def extract_jsonld(html):
     """Return (article_dict, breadcrumb_category) from the page's JSON-LD."""
-    for match in re.finditer(
-        r'<script[^>]*type=["\']application/ld\+json["\'][^>]*>(.*?)</script>',
-        html, re.DOTALL
-    ):
+    article = None
+    breadcrumb = None
+    for raw in _iter_jsonld(html):
         try:
-            data = json.loads(match.group(1))
+            data = _loads(raw)
             if isinstance(data, dict) and '@graph' in data:
                 graph = data['@graph']
             elif isinstance(data, list):
@@ -78,152 +160,182 @@ def extract_jsonld(html):
             else:
                 continue
 
-            article = next((d for d in graph if 'datePublished' in d), None)
+            if article is None:
+                article = next((d for d in graph if 'datePublished' in d), None)
 
             # BreadcrumbList: items[0]=Home, items[1]=section (e.g. "Industry News")
-            breadcrumb = next((d for d in graph if d.get('@type') == 'BreadcrumbList'), None)
-            category = None
-            if breadcrumb:
-                items = breadcrumb.get('itemListElement', [])
-                if len(items) >= 2:
-                    category = items[1].get('name')
+            if breadcrumb is None:
+                breadcrumb = next((d for d in graph if d.get('@type') == 'BreadcrumbList'), None)
 
-            if article:
-                return article, category
+            if article is not None and breadcrumb is not None:
+                break
 
-        except (json.JSONDecodeError, AttributeError):
+        except (ValueError, AttributeError):
             continue
-    return {}, None
+
+    category = None
+    if breadcrumb:
+        items = breadcrumb.get('itemListElement', [])
+        if len(items) >= 2 and isinstance(items[1], dict):
+            category = items[1].get('name')
+    return article or {}, category
 
 
 async def scrape_article(url, session, retries=3):
     for attempt in range(retries):
-        async with semaphore:
-            try:
-                timeout = aiohttp.ClientTimeout(total=20)
-                async with session.get(url, headers=HEADERS, timeout=timeout) as resp:
-                    if resp.status != 200:
-                        print(f"✗ {url}: HTTP {resp.status}")
-                        return None
-                    html = await resp.text()
-
-                data, breadcrumb_category = extract_jsonld(html)
-
-                # Title
-                title_match = re.search(r'<title>(.*?)</title>', html)
-                title = data.get('headline') or (title_match.group(1) if title_match else 'Unknown')
-                title = title.replace(' | The Payments Association', '').strip()
-
-                # Publication date
-                date_str = data.get('datePublished', '')
-                pub_date = datetime.fromisoformat(date_str) if date_str else None
-
-                # Author
-                author_data = data.get('author', {})
-                if isinstance(author_data, list):
-                    author_data = author_data[0] if author_data else {}
-                author = author_data.get('name', 'Unknown') if isinstance(author_data, dict) else 'Unknown'
-
-                # Article type — three-strategy fallback chain
-                article_type = 'Unknown'
-                container_match = re.search(r'class="([^"]*elementor-location-single[^"]*)"', html)
-
-                # Strategy 1: filter_types-* on the main article container (Thought Leadership etc.)
-                if container_match:
-                    type_match = re.search(r'filter_types-([a-z0-9-]+)', container_match.group(1))
-                    if type_match:
-                        raw = type_match.group(1)
-                        article_type = ARTICLE_TYPE_OVERRIDES.get(
-                            raw, ' '.join(w.capitalize() for w in raw.split('-'))
-                        )
-
-                # Strategy 2: BreadcrumbList second item from JSON-LD (free — already parsed)
-                if article_type == 'Unknown' and breadcrumb_category:
-                    article_type = breadcrumb_category
-
-                # Strategy 3: category-* class on the main article container
-                if article_type == 'Unknown' and container_match:
-                    cat_match = re.search(r'\bcategory-([a-z0-9-]+)\b', container_match.group(1))
-                    if cat_match:
-                        article_type = ' '.join(w.capitalize() for w in cat_match.group(1).split('-'))
-
-                # Status
-                if pub_date:
-                    status = 'DELETE_CANDIDATE' if pub_date.year < CUTOFF_YEAR else 'KEEP'
-                    reason = f'Published {pub_date.strftime("%b %Y")}{"  — over 3 years old" if status == "DELETE_CANDIDATE" else ""}'
-                else:
-                    status = 'REVIEW'
-                    reason = 'Could not determine publish date'
-
-                result = {
-                    'url': url,
-                    'title': title,
-                    'author': author,
-                    'published_date': pub_date.strftime('%Y-%m-%d') if pub_date else 'Unknown',
-                    'article_type': article_type,
-                    'status': status,
-                    'reason': reason,
-                }
-
-                icon = '🔴' if status == 'DELETE_CANDIDATE' else '🟢' if status == 'KEEP' else '🟠'
-                print(f"{icon} [{article_type}] {result['published_date']} — {title[:60]}")
-                return result
-
-            except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
-                if attempt < retries - 1:
-                    wait = 2 ** attempt
-                    print(f"  ⟳ Timeout on attempt {attempt + 1}, retrying in {wait}s — {url[-60:]}")
-                    await asyncio.sleep(wait)
-                else:
-                    print(f"✗ {url}: gave up after {retries} attempts")
+        try:
+            # total= would also count time queued for a pooled connection, so bound the socket instead
+            timeout = aiohttp.ClientTimeout(total=None, sock_connect=20, sock_read=20)
+            async with session.get(url, timeout=timeout) as resp:
+                if resp.status != 200:
+                    print(f"✗ {url}: HTTP {resp.status}")
                     return None
-
-            except Exception as e:
-                print(f"✗ {url}: {type(e).__name__}: {e}")
+                charset = resp.charset or 'utf-8'
+                html = await resp.read()
+
+            data, breadcrumb_category = extract_jsonld(html)
+
+            # Title
+            title = data.get('headline')
+            if not title:
+                title_match = _TITLE_RE.search(html)
+                title = title_match.group(1).decode(charset, 'replace') if title_match else 'Unknown'
+            title = title.replace(' | The Payments Association', '').strip()
+
+            # Publication date
+            # Only the YYYY-MM-DD prefix is used, so slice it rather than parsing the full ISO string
+            date_str = data.get('datePublished') or ''
+            published = None
+            if len(date_str) >= 10 and date_str[4] == '-' and date_str[7] == '-' and date_str[:4].isdigit():
+                month = date_str[5:7]
+                if month.isdigit() and 1 <= int(month) <= 12:
+                    published = date_str[:10]
+
+            # Author
+            author_data = data.get('author', {})
+            if isinstance(author_data, list):
+                author_data = author_data[0] if author_data else {}
+            author = author_data.get('name', 'Unknown') if isinstance(author_data, dict) else 'Unknown'
+
+            # Article type — three-strategy fallback chain
+            article_type = 'Unknown'
+            container_match = _CONTAINER_RE.search(html)
+            container_classes = container_match.group(1).decode(charset, 'replace') if container_match else ''
+
+            # Strategy 1: filter_types-* on the main article container (Thought Leadership etc.)
+            if container_classes:
+                type_match = _FILTER_RE.search(container_classes)
+                if type_match:
+                    raw = type_match.group(1)
+                    article_type = ARTICLE_TYPE_OVERRIDES.get(raw) or _slug_to_title(raw)
+
+            # Strategy 2: BreadcrumbList second item from JSON-LD (free — already parsed)
+            if article_type == 'Unknown' and breadcrumb_category:
+                article_type = breadcrumb_category
+
+            # Strategy 3: category-* class on the main article container
+            if article_type == 'Unknown' and container_classes:
+                cat_match = _CATEGORY_RE.search(container_classes)
+                if cat_match:
+                    article_type = _slug_to_title(cat_match.group(1))
+
+            # Status
+            if published:
+                year = int(published[:4])
+                status = 'DELETE_CANDIDATE' if year < CUTOFF_YEAR else 'KEEP'
+                reason = f'Published {_MONTHS[int(published[5:7]) - 1]} {year}{"  — over 3 years old" if status == "DELETE_CANDIDATE" else ""}'
+            else:
+                status = 'REVIEW'
+                reason = 'Could not determine publish date'
+
+            return ArticleRow(
+                url=url,
+                title=title,
+                author=author,
+                published_date=published or 'Unknown',
+                article_type=article_type,
+                status=status,
+                reason=reason,
+            )
+
+        except (asyncio.TimeoutError, aiohttp.ServerDisconnectedError) as e:
+            if attempt < retries - 1:
+                wait = 2 ** attempt
+                print(f"  ⟳ Timeout on attempt {attempt + 1}, retrying in {wait}s — {url[-60:]}")
+                await asyncio.sleep(wait)
+            else:
+                print(f"✗ {url}: gave up after {retries} attempts")
                 return None
 
+        except Exception as e:
+            print(f"✗ {url}: {type(e).__name__}: {e}")
+            return None
+
 
 async def main():
-    article_list = get_article_urls_from_sitemap()
-    total = len(article_list)
     completed = 0
 
-    print(f"=== Phase 2: Scraping {total} articles ({semaphore._value} concurrent, no browser) ===\n")
-
-    connector = aiohttp.TCPConnector(limit=20, ssl=False)
-    async with aiohttp.ClientSession(connector=connector) as session:
-
-        async def scrape_and_track(url):
-            nonlocal completed
-            result = await scrape_article(url, session)
-            completed += 1
-            if completed % 200 == 0:
-                print(f"  ↳ Progress: {completed}/{total} ({completed * 100 // total}%)")
-            return result
-
-        raw = await asyncio.gather(*[scrape_and_track(url) for url in article_list])
-        all_results = [r for r in raw if r]
-
-    all_results.sort(key=lambda x: x['published_date'])
+    audit_root = os.path.join('data', 'tpa-audit')
+    previous = load_previous_results(audit_root)
 
     date_str = datetime.now().strftime('%Y-%m-%d')
-    output_dir = os.path.join('data', 'tpa-audit', date_str)
+    output_dir = os.path.join(audit_root, date_str)
     os.makedirs(output_dir, exist_ok=True)
     output_path = os.path.join(output_dir, 'tpa_articles_audit.csv')
+    partial_path = output_path + '.partial'
+
+    connector = aiohttp.TCPConnector(
+        limit=20, limit_per_host=20, ssl=False,
+        ttl_dns_cache=600, keepalive_timeout=75, enable_cleanup_closed=True,
+    )
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS) as session:
+        article_list = await get_article_urls_from_sitemap(session)
+
+        # Filter before scraping so skipped URLs never take a connection
+        article_list = [u for u in article_list if not _SKIP_RE.search(u)]
+        reused = [previous[u] for u in article_list if u in previous]
+        article_list = [u for u in article_list if u not in previous]
+        total = len(article_list)
+
+        if reused:
+            print(f"Reusing {len(reused)} DELETE_CANDIDATE rows from the previous run")
+        print(f"=== Phase 2: Scraping {total} articles ({connector.limit} concurrent, no browser) ===\n")
+
+        # Rows are streamed to disk as they arrive and sorted in a final pass
+        with open(partial_path, 'w', newline='') as partial:
+            writer = csv.writer(partial)
+            writer.writerows(reused)
+
+            async def scrape_and_track(url):
+                nonlocal completed
+                result = await scrape_article(url, session)
+                completed += 1
+                if result:
+                    writer.writerow(result)
+                if completed % 200 == 0:
+                    print(f"  ↳ Progress: {completed}/{total} ({completed * 100 // total}%)")
+
+            await asyncio.gather(*[scrape_and_track(url) for url in article_list])
+
+    with open(partial_path, newline='') as f:
+        all_results = [ArticleRow(*row) for row in csv.reader(f)]
+    all_results.sort(key=lambda x: x.published_date)
 
     with open(output_path, 'w', newline='') as f:
-        writer = csv.DictWriter(f, fieldnames=['url', 'title', 'author', 'published_date', 'article_type', 'status', 'reason'])
-        writer.writeheader()
+        writer = csv.writer(f)
+        writer.writerow(ArticleRow._fields)
         writer.writerows(all_results)
+    os.remove(partial_path)
 
-    counts = Counter(r['status'] for r in all_results)
-    type_counts = Counter(r['article_type'] for r in all_results)
+    counts, type_counts = defaultdict(int), defaultdict(int)
+    for r in all_results:
+        counts[r.status] += 1
+        type_counts[r.article_type] += 1
     print(f"\n✅ Done! {len(all_results)} articles saved to {output_path}")
-    print(f"  🔴 DELETE_CANDIDATE : {counts.get('DELETE_CANDIDATE', 0)}")
-    print(f"  🟠 REVIEW           : {counts.get('REVIEW', 0)}")
-    print(f"  🟢 KEEP             : {counts.get('KEEP', 0)}")
+    for status, icon in _ICON.items():
+        print(f"  {icon} {status:<17}: {counts.get(status, 0)}")
     print("\nArticle types:")
-    for article_type, count in type_counts.most_common():
+    for article_type, count in sorted(type_counts.items(), key=lambda x: x[1], reverse=True):
         print(f"  {article_type:<30} {count}")
 
 
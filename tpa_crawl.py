@@ -1,18 +1,24 @@
 import asyncio
-from playwright.async_api import async_playwright
-from urllib.parse import urlparse
+import aiohttp
+from selectolax.parser import HTMLParser
+from urllib.parse import urljoin, urlparse, urlsplit
 import re
 import csv
 import os
+from collections import defaultdict
 from datetime import datetime, timezone
 
 BASE_URL = "https://thepaymentsassociation.org"
+_SITE_PREFIXES = ("http://thepaymentsassociation.org", "https://thepaymentsassociation.org")
+_ABSOLUTE_PREFIXES = ("http://", "https://")
 visited = set()
 found_urls = []
-semaphore = asyncio.Semaphore(10)
+WORKERS = 10
 
 CUTOFF_YEAR = datetime.now(timezone.utc).year - 3
 
+HEADERS = {'User-Agent': 'Mozilla/5.0 (Macintosh; Intel Mac OS X 10_15_7) AppleWebKit/537.36'}
+
 SKIP_PATTERNS = [
     r'/events/tag/',
     r'/events/category/',
@@ -24,13 +30,27 @@ SKIP_PATTERNS = [
     r'/feed/',
     r'/author/',
 ]
+_SKIP_RE = re.compile('|'.join(f'(?:{p})' for p in SKIP_PATTERNS))
+
+# segment: (old_status, old_reason_fmt, status, reason) — year-gated when old_reason_fmt is set
+_RULES = {
+    'gallery': ('DELETE_CANDIDATE', 'Old gallery page from {year}', 'KEEP', 'Recent gallery page'),
+    'event': ('DELETE_CANDIDATE', 'Past event from {year}', 'REVIEW', 'Past or upcoming event — check if still relevant'),
+    'directory': (None, None, 'REVIEW', 'Check if member is still active'),
+    'filter_categories': (None, None, 'REVIEW', 'Auto-generated category page — check if needed'),
+    'directory_cat': (None, None, 'REVIEW', 'Auto-generated category page — check if needed'),
+    'webinar': ('DELETE_CANDIDATE', 'Old webinar from {year}', 'KEEP', 'Webinar page'),
+    'article': (None, None, 'KEEP', 'Content page'),
+    'whitepaper': (None, None, 'KEEP', 'Content page'),
+}
+_YEAR_RE = re.compile(r'\d{4}')
+_STATUS_ORDER = {'DELETE_CANDIDATE': 0, 'DUPLICATE': 1, 'REVIEW': 2, 'KEEP': 3}
 
 def should_skip(url):
-    return any(re.search(pattern, url) for pattern in SKIP_PATTERNS)
+    return _SKIP_RE.search(url) is not None
 
 def is_top_level(url):
-    parsed = urlparse(url)
-    parts = [p for p in parsed.path.split('/') if p]
+    parts = [p for p in urlsplit(url).path.split('/') if p]
     return len(parts) <= 2
 
 def categorise(url):
@@ -46,93 +66,84 @@ def categorise(url):
         if path == pair[0]:
             return 'DUPLICATE', f'Possible duplicate of {BASE_URL}{pair[1]}'
 
-    # Gallery pages
-    if '/gallery/' in path:
-        year_match = re.search(r'(\d{4})', path)
-        if year_match and int(year_match.group(1)) < CUTOFF_YEAR:
-            return 'DELETE_CANDIDATE', f'Old gallery page from {year_match.group(1)}'
-        return 'KEEP', 'Recent gallery page'
-
-    # Past event pages
-    if '/event/' in path:
-        year_match = re.search(r'(\d{4})', path)
-        if year_match and int(year_match.group(1)) < CUTOFF_YEAR:
-            return 'DELETE_CANDIDATE', f'Past event from {year_match.group(1)}'
-        return 'REVIEW', 'Past or upcoming event — check if still relevant'
-
-    # Directory pages
-    if '/directory/' in path:
-        return 'REVIEW', 'Check if member is still active'
-
-    # Filter/tag category pages
-    if '/filter_categories/' in path or '/directory_cat/' in path:
-        return 'REVIEW', 'Auto-generated category page — check if needed'
-
-    # Webinar pages
-    if '/webinar/' in path:
-        year_match = re.search(r'(\d{4})', path)
-        if year_match and int(year_match.group(1)) < CUTOFF_YEAR:
-            return 'DELETE_CANDIDATE', f'Old webinar from {year_match.group(1)}'
-        return 'KEEP', 'Webinar page'
-
-    # Articles and whitepapers
-    if '/article/' in path or '/whitepaper/' in path:
-        return 'KEEP', 'Content page'
+    # Dispatch on the first path segment; only /segment/... paths are section pages
+    segments = path.strip('/').split('/')
+    kind = segments[0] if len(segments) > 1 else ''
+    rule = _RULES.get(kind)
+    if rule:
+        old_status, old_reason_fmt, status, reason = rule
+        if old_reason_fmt:
+            year_match = _YEAR_RE.search(path)
+            if year_match:
+                year = year_match.group()
+                if int(year) < CUTOFF_YEAR:
+                    return old_status, old_reason_fmt.format(year=year)
+        return status, reason
 
     # Core pages
     return 'KEEP', 'Core site page'
 
-async def crawl_url(url, browser):
-    async with semaphore:
-        context = await browser.new_context()
-        page = await context.new_page()
-        new_links = []
-
+async def crawl_url(url, session):
+    new_links = []
+
+    try:
+        timeout = aiohttp.ClientTimeout(total=30)
+        async with session.get(url, timeout=timeout) as resp:
+            html = await resp.text()
+
+        # Pages are server-rendered, so hrefs can be read straight from the HTML
+        tree = HTMLParser(html)
+        links = [a.attributes.get('href') or '' for a in tree.css('a[href]')]
+
+        for link in links:
+            if not link.startswith(_ABSOLUTE_PREFIXES):
+                link = urljoin(url, link)
+            # Cheap literal check first so external links are never parsed
+            if not link.startswith(_SITE_PREFIXES):
+                continue
+            parts = urlsplit(link)
+            if parts.netloc != "thepaymentsassociation.org":
+                continue
+            clean = BASE_URL + parts.path.rstrip("/")
+            if not should_skip(clean) and is_top_level(clean):
+                if clean not in visited:
+                    new_links.append(clean)
+
+        print(f"✓ {url} — {len(links)} links found")
+
+    except Exception as e:
+        print(f"✗ {url}: {e}")
+
+    return new_links
+
+async def worker(queue, session):
+    while True:
+        url = await queue.get()
         try:
-            await page.goto(url, timeout=30000, wait_until="domcontentloaded")
-            links = await page.eval_on_selector_all("a[href]", "els => els.map(el => el.href)")
-
-            for link in links:
-                parsed = urlparse(link)
-                if parsed.netloc == "thepaymentsassociation.org":
-                    clean = parsed.scheme + "://" + parsed.netloc + parsed.path.rstrip("/")
-                    if not should_skip(clean) and is_top_level(clean):
-                        if clean not in visited:
-                            new_links.append(clean)
-
-            print(f"✓ {url} — {len(links)} links found")
-
-        except Exception as e:
-            print(f"✗ {url}: {e}")
+            if url not in visited and not should_skip(url):
+                visited.add(url)
+                for link in await crawl_url(url, session):
+                    if link not in visited:
+                        queue.put_nowait(link)
         finally:
-            await context.close()
-
-        return new_links
+            queue.task_done()
 
 async def main():
-    async with async_playwright() as p:
-        browser = await p.chromium.launch()
-        to_visit = [BASE_URL]
-
-        while to_visit:
-            batch = []
-            while to_visit and len(batch) < 10:
-                url = to_visit.pop()
-                if url not in visited and not should_skip(url):
-                    visited.add(url)
-                    batch.append(url)
-
-            if not batch:
-                break
-
-            print(f"\n--- Batch of {len(batch)} | Visited: {len(visited)} | Queue: {len(to_visit)} ---")
-
-            results = await asyncio.gather(*[crawl_url(url, browser) for url in batch])
-
-            for new_links in results:
-                to_visit.extend(new_links)
-
-        await browser.close()
+    connector = aiohttp.TCPConnector(
+        limit=20, limit_per_host=20, ssl=False,
+        ttl_dns_cache=600, keepalive_timeout=75, enable_cleanup_closed=True,
+    )
+    async with aiohttp.ClientSession(connector=connector, headers=HEADERS) as session:
+        # Workers pull continuously, so one slow page no longer holds up a whole batch
+        queue = asyncio.Queue()
+        queue.put_nowait(BASE_URL)
+        workers = [asyncio.create_task(worker(queue, session)) for _ in range(WORKERS)]
+
+        await queue.join()
+
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
 
     # Categorise all found URLs
     rows = []
@@ -141,8 +152,7 @@ async def main():
         rows.append({'url': url, 'status': status, 'reason': reason})
 
     # Sort by status so DELETE_CANDIDATE and DUPLICATE appear first
-    status_order = {'DELETE_CANDIDATE': 0, 'DUPLICATE': 1, 'REVIEW': 2, 'KEEP': 3}
-    rows.sort(key=lambda x: status_order.get(x['status'], 99))
+    rows.sort(key=lambda x: _STATUS_ORDER.get(x['status'], 99))
 
     date_str = datetime.now().strftime('%Y-%m-%d')
     output_dir = os.path.join('data', 'tpa-audit', date_str)
@@ -155,8 +165,9 @@ async def main():
         writer.writerows(rows)
 
     # Summary
-    from collections import Counter
-    counts = Counter(r['status'] for r in rows)
+    counts = defaultdict(int)
+    for r in rows:
+        counts[r['status']] += 1
     print(f"\nDone! Found {len(rows)} URLs saved to {output_path}")
     print(f"  DELETE_CANDIDATE : {counts.get('DELETE_CANDIDATE', 0)}")
     print(f"  DUPLICATE        : {counts.get('DUPLICATE', 0)}")